@@ -1,7 +1,10 @@
-from flask import Flask, render_template, request, redirect, flash, url_for
-from generate_data import main as generate_data_main
+import time
+import_start = time.perf_counter()
+from flask import Flask, render_template, request, redirect, flash, url_for, jsonify, \
+    Response, stream_with_context
 import traceback, os
-import db_manager, complex
+import db_manager, complex, loaders, write_behind, shared_cache
+import_ms = (time.perf_counter() - import_start) * 1000
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
@@ -13,6 +16,17 @@ def build_search_query(base_query, search_term, fields):
     condition = " OR ".join(f"{f} LIKE %s" for f in fields)
     return base_query + " WHERE " + condition, tuple([like] * len(fields))
 
+def build_prefix_search(base_query, search_term, fields):
+    """
+    Like build_search_query, but matches values that start with the term. A
+    prefix LIKE can range-scan each field's index, where '%term%' reads every row.
+    """
+    if not search_term:
+        return base_query, None
+    escaped = db_manager.escape_like(search_term)
+    condition = " OR ".join(f"{f} LIKE %s" for f in fields)
+    return base_query + " WHERE " + condition, tuple([escaped + "%"] * len(fields))
+
 @app.route('/students')
 def students():
     sort = request.args.get('sort', 'student_id')
@@ -27,17 +41,17 @@ def students():
     query, params = build_search_query(base, search, ["first_name", "last_name", "email"])
     query += f" ORDER BY {sort} {order}"
 
-    data = db_manager.query_dict(query, params)
+    data = db_manager.query_rows(query, params)
     return render_template("students/students.html", students=data, sort=sort, order=order, search=search)
 
 
 @app.route('/add_student', methods=['GET', 'POST'])
 def add_student():
-    db = db_manager.get_db()
-    if not db:
-        return "<h2>Could not connect to database.</h2>", 500
-
     if request.method == 'POST':
+        db = db_manager.get_db()
+        if not db:
+            return "<h2>Could not connect to database.</h2>", 500
+
         try:
             first = request.form['first_name'].strip()
             last = request.form['last_name'].strip()
@@ -63,12 +77,15 @@ def add_student():
 
             db.commit()
             cursor.close()
+            shared_cache.invalidate()
 
             return redirect('/students')
         except Exception:
             db.rollback()
             traceback.print_exc()
             return "<h2>Database insertion failed.</h2>", 500
+        finally:
+            db_manager.release(db)
 
     return render_template("students/add_student.html")
 
@@ -77,7 +94,8 @@ def add_student():
 def delete_student():
     if request.method == 'POST':
         sid = request.form['student_id']
-        ok = db_manager.execute("DELETE FROM enrollment WHERE student_id=%s", (sid,)) \
+        ok = db_manager.execute("DELETE FROM enrollment_archive WHERE student_id=%s", (sid,)) \
+             and db_manager.execute("DELETE FROM enrollment WHERE student_id=%s", (sid,)) \
              and db_manager.execute("DELETE FROM student WHERE student_id=%s", (sid,))
         return redirect('/students') if ok else "<h2>Delete failed.</h2>"
     return render_template("students/delete_student.html")
@@ -102,11 +120,36 @@ def instructors():
         ["i.first_name", "i.last_name", "i.email", "d.department_name"])
 
     query += f" ORDER BY {sort} {order}"
-    data = db_manager.query_dict(query, params)
+    data = db_manager.query_rows(query, params)
     return render_template("instructors/instructors.html",
                            instructors=data, sort=sort, order=order, search=search)
 
 
+@app.route('/instructor_loads')
+def instructor_loads():
+    ld = loaders.get_loaders()
+
+    instructors = ld.query_dict("""
+        SELECT i.instructor_id, i.first_name, i.last_name, d.department_name
+        FROM instructor i
+        LEFT JOIN department d ON i.department_id = d.department_id
+        ORDER BY i.last_name, i.first_name
+    """)
+    ids = [i['instructor_id'] for i in instructors]
+    sections = dict(zip(ids, ld.instructor_sections.load_many(ids)))
+    section_ids = [s['section_id'] for rows in sections.values() for s in rows]
+    headcounts = dict(zip(section_ids, ld.headcount.load_many(section_ids)))
+
+    for i in instructors:
+        rows = sections[i['instructor_id']]
+        i['num_sections'] = len(rows)
+        i['credits'] = sum(s['credits'] for s in rows)
+        i['headcount'] = sum(headcounts[s['section_id']] for s in rows)
+
+    return render_template("instructors/loads.html",
+        instructors=instructors, queries=ld.queries)
+
+
 @app.route('/add_instructor', methods=['GET', 'POST'])
 def add_instructor():
     if request.method == 'POST':
@@ -131,6 +174,7 @@ def delete_instructor():
         iid = request.form['instructor_id']
 
         ok = db_manager.execute("UPDATE department SET chair_id=NULL WHERE chair_id=%s", (iid,)) \
+             and db_manager.execute("UPDATE section SET instructor_id=NULL WHERE instructor_id=%s", (iid,)) \
              and db_manager.execute("DELETE FROM instructor WHERE instructor_id=%s", (iid,))
 
         return redirect('/instructors') if ok else "<h2>Delete failed.</h2>"
@@ -150,7 +194,7 @@ def courses():
         WHERE c.course_name LIKE %s OR c.course_code LIKE %s
     """
 
-    data = db_manager.query_dict(base + f" ORDER BY {sort} {order}",
+    data = db_manager.query_rows(base + f" ORDER BY {sort} {order}",
                                  (f"%{search}%", f"%{search}%"))
 
     return render_template("courses/courses.html",
@@ -179,8 +223,14 @@ def delete_course():
     if request.method == 'POST':
         cid = request.form['course_id']
 
-        # Delete enrollments for all sections of this course
+        # Delete enrollments for all sections of this course, archived ones included
         ok = db_manager.execute("""
+            DELETE e FROM enrollment_archive e
+            JOIN section_archive s ON e.section_id = s.section_id
+            WHERE s.course_id=%s
+        """, (cid,)) and db_manager.execute(
+            "DELETE FROM section_archive WHERE course_id=%s", (cid,)
+        ) and db_manager.execute("""
             DELETE e FROM enrollment e
             JOIN section s ON e.section_id = s.section_id
             WHERE s.course_id=%s
@@ -204,7 +254,7 @@ def departments():
     order = request.args.get('order', 'asc')
     search = request.args.get('search', '')
 
-    data = db_manager.query_dict(f"""
+    data = db_manager.query_rows(f"""
         SELECT d.department_id, d.department_name, d.office_location,
                CONCAT(i.first_name,' ',i.last_name) AS chair_name
         FROM department d
@@ -217,6 +267,32 @@ def departments():
                            departments=data, sort=sort, order=order, search=search)
 
 
+@app.route('/departments/<int:department_id>')
+def department_detail(department_id):
+    ld = loaders.get_loaders()
+
+    rows = ld.query_dict("""
+        SELECT d.department_id, d.department_name, d.office_location,
+               CONCAT(i.first_name,' ',i.last_name) AS chair_name
+        FROM department d
+        LEFT JOIN instructor i ON d.chair_id = i.instructor_id
+        WHERE d.department_id = %s
+    """, (department_id,))
+    if not rows:
+        return "<h2>Department not found.</h2>", 404
+
+    courses = ld.department_courses.load(department_id)
+    instructors = ld.department_instructors.load(department_id)
+    course_ids = [c['course_id'] for c in courses]
+    sections = dict(zip(course_ids, ld.course_sections.load_many(course_ids)))
+    section_ids = [s['section_id'] for rows in sections.values() for s in rows]
+    headcounts = dict(zip(section_ids, ld.headcount.load_many(section_ids)))
+
+    return render_template("departments/department_detail.html",
+        department=rows[0], courses=courses, instructors=instructors,
+        sections=sections, headcounts=headcounts, queries=ld.queries)
+
+
 @app.route('/add_department', methods=['GET', 'POST'])
 def add_department():
     if request.method == 'POST':
@@ -255,19 +331,22 @@ def delete_department():
 def sections():
     sort = request.args.get('sort', 'section_id')
     order = request.args.get('order', 'asc')
-    search = request.args.get('search', '')
+    search = request.args.get('search', '').strip()
 
-    data = db_manager.query_dict(f"""
-        SELECT s.section_id, c.course_code, s.section_code, s.term, s.year,
-               s.days, s.time, s.location,
-               CONCAT(i.first_name,' ',i.last_name) AS instructor
-        FROM section s
-        JOIN course c ON s.course_id = c.course_id
-        LEFT JOIN instructor i ON s.instructor_id = i.instructor_id
-        WHERE s.section_code LIKE %s OR c.course_code LIKE %s
-              OR CONCAT(i.first_name,' ',i.last_name) LIKE %s
-        ORDER BY {sort} {order}
-    """, (f"%{search}%", f"%{search}%", f"%{search}%"))
+    valid_sorts = ['section_id', 'course_code', 'section_code', 'term', 'year',
+                   'days', 'time', 'location', 'instructor']
+    if sort not in valid_sorts:
+        sort = 'section_id'
+    if order not in ('asc', 'desc'):
+        order = 'asc'
+
+    # section_listing is kept up to date by triggers, see db_manager.read_model_triggers
+    query, params = build_prefix_search("""
+        SELECT section_id, course_code, section_code, term, year,
+               days, time, location, instructor
+        FROM section_listing
+    """, search, ["section_code", "course_code", "instructor", "instructor_last_name"])
+    data = db_manager.query_rows(query + f" ORDER BY {sort} {order}", params)
 
     return render_template("sections/sections.html",
                            sections=data, sort=sort, order=order, search=search)
@@ -312,24 +391,49 @@ def delete_section():
     return render_template("sections/delete_section.html")
 
 
+@app.route('/rosters')
+def rosters():
+    search = request.args.get('search', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = 25
+    ld = loaders.get_loaders()
+
+    sections = ld.query_dict("""
+        SELECT s.section_id, s.section_code, s.term, s.year, s.capacity, c.course_name
+        FROM section s
+        JOIN course c ON s.course_id = c.course_id
+        WHERE s.section_code LIKE %s
+        ORDER BY s.section_code
+        LIMIT %s OFFSET %s
+    """, (f"%{search}%", per_page + 1, (page - 1) * per_page))
+    has_next = len(sections) > per_page
+    sections = sections[:per_page]
+
+    ids = [s['section_id'] for s in sections]
+    rosters = dict(zip(ids, ld.roster.load_many(ids)))
+
+    return render_template("sections/rosters.html",
+        sections=sections, rosters=rosters, search=search,
+        page=page, has_next=has_next, queries=ld.queries)
+
 @app.route('/enrollments')
 def enrollments():
     sort = request.args.get('sort', 'enrollment_id')
     order = request.args.get('order', 'asc')
-    search = request.args.get('search', '')
+    search = request.args.get('search', '').strip()
 
-    data = db_manager.query_dict(f"""
-        SELECT e.enrollment_id,
-               CONCAT(s.first_name,' ',s.last_name) AS student_name,
-               c.course_code, c.course_name, e.grade
-        FROM enrollment e
-        JOIN student s ON e.student_id = s.student_id
-        JOIN section se ON e.section_id = se.section_id
-        JOIN course c ON se.course_id = c.course_id
-        WHERE CONCAT(s.first_name,' ',s.last_name) LIKE %s
-           OR c.course_code LIKE %s OR c.course_name LIKE %s
-        ORDER BY {sort} {order}
-    """, (f"%{search}%", f"%{search}%", f"%{search}%"))
+    valid_sorts = ['enrollment_id', 'student_name', 'course_code', 'course_name', 'grade']
+    if sort not in valid_sorts:
+        sort = 'enrollment_id'
+    if order not in ('asc', 'desc'):
+        order = 'asc'
+
+    # enrollment_roster is kept up to date by triggers, see db_manager.read_model_triggers
+    query, params = build_prefix_search("""
+        SELECT enrollment_id, student_name, course_code, course_name, grade
+        FROM enrollment_roster
+    """, search, ["student_name", "student_last_name", "course_code", "course_name"])
+    data = db_manager.query_rows(query + f" ORDER BY {sort} {order}", params)
 
     return render_template("enrollments/enrollments.html",
                            enrollments=data, sort=sort, order=order, search=search)
@@ -337,6 +441,15 @@ def enrollments():
 
 @app.route('/add_enrollment', methods=['GET', 'POST'])
 def add_enrollment():
+    if request.method == 'POST' and write_behind.ENABLED:
+        row = write_behind.validate_enrollment(request.form)
+        if row is None:
+            return "<h2>Invalid enrollment.</h2>", 400
+        ticket = write_behind.enrollments.submit(*row)
+        if ticket is None:
+            return "<h2>Too many enrollments waiting to be saved. Try again shortly.</h2>", 503
+        return redirect(url_for('enrollment_status', ticket=ticket))
+
     if request.method == 'POST':
         ok = db_manager.execute("""
             INSERT INTO enrollment (student_id, section_id, grade)
@@ -350,6 +463,12 @@ def add_enrollment():
         return redirect('/enrollments') if ok else "<h2>Insert failed.</h2>"
     return render_template("enrollments/add_enrollment.html")
 
+@app.route('/enrollment_status/<ticket>')
+def enrollment_status(ticket):
+    status = write_behind.enrollments.get_status(ticket)
+    return render_template("enrollments/enrollment_status.html",
+        ticket=ticket, status=status or 'unknown')
+
 @app.route('/delete_enrollment', methods=['GET', 'POST'])
 def delete_enrollment():
     if request.method == 'POST':
@@ -360,8 +479,9 @@ def delete_enrollment():
 
 @app.route('/reports', methods=['GET', 'POST'])
 def reports():
-    busiest = complex.get_highest_enrolled_sections()
-    dept_stats = complex.get_department_stats()
+    # Reports return None when the database failed; show those as empty
+    busiest = complex.get_highest_enrolled_sections() or []
+    dept_stats = complex.get_department_stats() or []
     majors = []
     transcripts = []
     selected_major = None
@@ -375,9 +495,9 @@ def reports():
             majors = complex.get_students_by_major(selected_major)
 
         if selected_student:
-            transcripts = complex.student_transcript(selected_student)
+            transcripts = complex.student_transcript(selected_student) or []
 
-    top_gpa = complex.get_top_students_by_gpa()
+    top_gpa = complex.get_top_students_by_gpa() or []
 
     return render_template("reports/reports.html",
         busiest_sections=busiest,
@@ -388,15 +508,128 @@ def reports():
         student_transcripts=transcripts,
         selected_student_id=selected_student)
 
+@app.route('/transcripts')
+def transcripts():
+    page = max(request.args.get('page', 1, type=int), 1)
+    major = request.args.get('major', '').strip() or None
+    cohort = request.args.get('cohort', type=int)
+
+    start = time.perf_counter()
+    data, has_next = complex.transcript_page(page, major=major, cohort=cohort)
+    elapsed = time.perf_counter() - start
+    if data is None:
+        return "<h2>Could not load transcripts.</h2>", 500
+
+    return render_template("transcripts/transcripts.html",
+        transcripts=data,
+        page=page,
+        has_next=has_next,
+        major=major or '',
+        majors=complex.get_majors(),
+        cohort=cohort or '',
+        rate=len(data) / elapsed if elapsed > 0 else 0.0)
+
+@app.route('/transcripts/export')
+def export_transcripts():
+    fmt = request.args.get('format', 'csv')
+    ids = request.args.get('ids', '')
+    student_ids = [int(i) for i in ids.split(',') if i.strip().isdigit()]
+    if ids.strip() and not student_ids:
+        return "<h2>No valid student IDs given.</h2>", 400
+    major = request.args.get('major', '').strip() or None
+    cohort = request.args.get('cohort', type=int)
+
+    rows = complex.timed_transcripts(
+        complex.batch_transcripts(student_ids=student_ids, major=major, cohort=cohort),
+        label="Transcript export")
+
+    if fmt == 'json':
+        return Response(stream_with_context(complex.transcripts_json(rows)),
+                        mimetype='application/json')
+    return Response(stream_with_context(complex.transcripts_csv(rows)),
+                    mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=transcripts.csv'})
+
+@app.route('/search')
+def search():
+    term = request.args.get('q', '').strip()
+    results, elapsed_ms = complex.global_search(term)
+
+    return render_template("search/search.html",
+        results=results,
+        term=term,
+        elapsed_ms=elapsed_ms,
+        budget_ms=complex.SEARCH_BUDGET_MS)
+
+@app.route('/changes')
+def changes():
+    since = request.args.get('since', 0, type=int)
+    limit = max(1, min(request.args.get('limit', 1000, type=int), 10000))
+
+    rows = db_manager.changes_since(since, limit)
+    if rows is None:
+        return jsonify(error="Could not read change log."), 500
+
+    return jsonify(
+        changes=rows,
+        next_since=rows[-1]["seq"] if rows else since,
+        has_more=len(rows) == limit)
+
 @app.route("/generate-data", methods=["POST"])
 def generate_data():
+    # Imported here so workers don't load Faker unless this route is used
+    from generate_data import main as generate_data_main
     generate_data_main()  # call generate_data.py
+    shared_cache.invalidate()
     flash("Database has been reset and populated successfully!")
     return redirect(url_for("home"))  # redirect to main page
 
 @app.route('/')
 def home():
     return render_template("index.html")
+
+PREWARM = os.getenv("APP_PREWARM") == "1"
+
+def timed_phase(timings, name, fn):
+    start = time.perf_counter()
+    fn()
+    timings[name] = (time.perf_counter() - start) * 1000
+    print(f"STARTUP {name}: {timings[name]:.1f} ms")
+
+def warm_up():
+    """
+    Compiles every template and fills the shared report cache at import. Under
+    gunicorn --preload this runs in the master, so it only warms what forked
+    workers inherit, then closes the connections it used; each worker fills
+    its own pool in warm_worker. Returns phase timings.
+    """
+    timings = {"imports": import_ms}
+    print(f"STARTUP imports: {import_ms:.1f} ms")
+    timed_phase(timings, "templates", lambda: [app.jinja_env.get_template(name)
+                                               for name in app.jinja_env.list_templates()])
+    timed_phase(timings, "report cache", lambda: (complex.get_highest_enrolled_sections(),
+                                                  complex.get_department_stats(),
+                                                  complex.get_top_students_by_gpa()))
+    db_manager.close_pool()
+    return timings
+
+_warmed_pid = None
+
+@app.before_request
+def warm_worker():
+    """
+    Opens this worker's full connection pool on its first request, so the
+    requests after it do not each wait on a new connection. Can also be called
+    from a gunicorn post_fork hook to do it before any request arrives.
+    """
+    global _warmed_pid
+    if PREWARM and _warmed_pid != os.getpid():
+        _warmed_pid = os.getpid()
+        timed_phase({}, "db pool", db_manager.prewarm_pool)
+
+if PREWARM:
+    warm_up()
+
 if __name__ == '__main__':
     print("Flask server starting...")
     app.run(debug=True)
\ No newline at end of file
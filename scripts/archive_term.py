@@ -0,0 +1,21 @@
+import sys
+import db_manager
+
+def main():
+    usage = "Usage: python archive_term.py <term> <year>   e.g. python archive_term.py Fall 2024"
+    if len(sys.argv) != 3 or not sys.argv[2].isdigit():
+        print(usage)
+        exit(1)
+
+    term, year = sys.argv[1], int(sys.argv[2])
+    moved = db_manager.archive_term(term, year)
+    if moved is None:
+        print(f"Error: could not archive {term} {year}.")
+        exit(1)
+    if moved == 0:
+        print(f"No sections found for {term} {year}; nothing archived.")
+        exit(1)
+    print(f"Archived {moved} sections from {term} {year}.")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,34 @@
 import db_manager
+import shared_cache
+import csv
+import io
+import json
+import math
+import time
 from pprint import pprint
 
-def get_highest_enrolled_sections():
+# Live and archived tables, one pair per branch of a history query
+HISTORY_TABLES = [("enrollment", "section"), ("enrollment_archive", "section_archive")]
+
+def history_union(template):
+    """
+    Expands a query template over live and archived rows as a UNION ALL.
+    {enrollment} and {section} name each branch's tables, so every branch
+    filters and aggregates on its own indexes instead of going through the
+    materialized *_history views. Parameters must be repeated per branch.
+    """
+    return "\nUNION ALL\n".join(f"({template.format(enrollment=e, section=s)})"
+                                 for e, s in HISTORY_TABLES)
+
+@shared_cache.cached()
+def get_highest_enrolled_sections(year=None):
     """
     Retrieves the course sections with the highest number of enrollments.
+    Only sections from `year` are scanned, defaulting to the current year.
     """
+    year = year or db_manager.current_year()
+    if year is None:
+        return None
     query = """
     SELECT 
         c.course_code, 
@@ -17,6 +41,8 @@ def get_highest_enrolled_sections():
         course c ON s.course_id = c.course_id
     JOIN 
         enrollment e ON s.section_id = e.section_id
+    WHERE
+        s.year = %s
     GROUP BY 
         s.section_id, c.course_code, c.course_name, s.section_code
     ORDER BY 
@@ -24,7 +50,10 @@ def get_highest_enrolled_sections():
     LIMIT 10;
     """
         
-    results = db_manager.query_all(query)
+    results = db_manager.query_rows(query, (year,))
+    # None (a failed query) is passed on so the cache does not keep it as "no rows"
+    if results is None:
+        return None
     sections = []
     if results:
         for row in results:
@@ -36,6 +65,7 @@ def get_highest_enrolled_sections():
             })
     return sections
 
+@shared_cache.cached()
 def get_department_stats():
     """
     Calculates the total number of instructors and courses per department.
@@ -56,7 +86,9 @@ def get_department_stats():
     ORDER BY num_instructors DESC;
     """
         
-    results = db_manager.query_all(query)
+    results = db_manager.query_rows(query)
+    if results is None:
+        return None
     departments = []
     if results:
         for row in results:
@@ -69,6 +101,7 @@ def get_department_stats():
             })
     return departments
 
+@shared_cache.cached()
 def get_students_by_major(major_name: str):
     """
     Finds students enrolled in a specific major.
@@ -83,10 +116,20 @@ def get_students_by_major(major_name: str):
     WHERE 
         major = %s;
     """
-    results = db_manager.query_all(query, (major_name,))
+    results = db_manager.query_rows(query, (major_name,))
         
-    return results
+    # Plain tuples so the rows can be pickled into the shared cache
+    return [tuple(row) for row in results] if results is not None else None
+
+def get_majors():
+    """
+    Returns the distinct majors students are enrolled in, alphabetically.
+    """
+    results = db_manager.query_rows(
+        "SELECT DISTINCT major FROM student WHERE major IS NOT NULL ORDER BY major")
+    return [row[0] for row in results] if results else []
 
+@shared_cache.cached()
 def get_top_students_by_gpa(limit=10):
     """
     Returns the top N students by GPA calculated from their enrollments.
@@ -97,31 +140,23 @@ def get_top_students_by_gpa(limit=10):
         s.first_name,
         s.last_name,
         s.major,
-        AVG(
-            CASE grade
-                WHEN 'A' THEN 4.0
-                WHEN 'A-' THEN 3.7
-                WHEN 'B+' THEN 3.3
-                WHEN 'B' THEN 3.0
-                WHEN 'B-' THEN 2.7
-                WHEN 'C+' THEN 2.3
-                WHEN 'C' THEN 2.0
-                WHEN 'C-' THEN 1.7
-                WHEN 'D+' THEN 1.3
-                WHEN 'D' THEN 1.0
-                WHEN 'F' THEN 0
-                ELSE NULL
-            END
-        ) AS gpa
+        SUM(g.points) / SUM(g.graded) AS gpa
     FROM student s
-    JOIN enrollment e ON s.student_id = e.student_id
+    JOIN (
+    """ + history_union("""
+        SELECT student_id, SUM(quality_points) AS points, COUNT(quality_points) AS graded
+        FROM {enrollment}
+        GROUP BY student_id
+    """) + """
+    ) g ON g.student_id = s.student_id
     GROUP BY s.student_id, s.first_name, s.last_name, s.major
     HAVING gpa IS NOT NULL
     ORDER BY gpa DESC
     LIMIT %s;
     """
-    results = db_manager.query_all(query, (limit,))
-    
+    results = db_manager.query_rows(query, (limit,))
+    if results is None:
+        return None
     students = []
     if results:
         for row in results:
@@ -134,37 +169,38 @@ def get_top_students_by_gpa(limit=10):
             })
     return students
 
+@shared_cache.cached()
 def student_transcript(student_id):
     """
-    Returns transcript of student with sql and GPA with python using credits and grades
+    Returns transcript of student with sql and GPA with python using credits and quality points
     """
     query = """
     SELECT
         c.course_code,
         c.course_name,
         c.credits,
-        s.term,
-        s.year,
-        e.grade
-    FROM enrollment e
-    JOIN section s ON s.section_id = e.section_id
-    JOIN course c ON c.course_id = s.course_id
-    WHERE e.student_id = %s
-    ORDER BY s.year, s.term;
+        h.term,
+        h.year,
+        h.grade,
+        h.quality_points
+    FROM (
+    """ + history_union("""
+        SELECT s.course_id, s.term, s.year, e.grade, e.quality_points
+        FROM {enrollment} e
+        JOIN {section} s ON s.section_id = e.section_id
+        WHERE e.student_id = %s
+    """) + """
+    ) h
+    JOIN course c ON c.course_id = h.course_id
+    ORDER BY h.year, h.term;
     """
-    results = db_manager.query_all(query, (student_id,))
-    
+    results = db_manager.query_rows(query, (student_id,) * len(HISTORY_TABLES))
+    if results is None:
+        return None
     student_transcripts = []
     total_points = 0.0
     total_credits = 0.0
 
-    grade_points = {
-        'A': 4.0, 'A-': 3.7,
-        'B+': 3.3, 'B': 3.0, 'B-': 2.7,
-        'C+': 2.3, 'C': 2.0, 'C-': 1.7,
-        'D': 1.0, 'F': 0.0
-    }
-
     if results:
         for row in results:
             course_code = row[0]
@@ -174,9 +210,9 @@ def student_transcript(student_id):
             year = row[4]
             grade = row[5]
 
-            points = grade_points.get(grade)
+            points = row[6]
             if points is not None:
-                total_points += points * credits
+                total_points += float(points) * credits
                 total_credits += credits
 
             student_transcripts.append({
@@ -194,4 +230,250 @@ def student_transcript(student_id):
     for row in student_transcripts:
         row["cumulative_gpa"] = cumulative_gpa
 
-    return student_transcripts
\ No newline at end of file
+    return student_transcripts
+
+# Entity types covered by global_search, in display order. Each entry gives the
+# table, the id column, the display label, a detail column and the matched columns.
+SEARCH_ENTITIES = [
+    ("student", "student", "student_id", "CONCAT(first_name,' ',last_name)", "email",
+     ["first_name", "last_name", "email", "CONCAT(first_name,' ',last_name)"]),
+    ("instructor", "instructor", "instructor_id", "CONCAT(first_name,' ',last_name)", "email",
+     ["first_name", "last_name", "email", "CONCAT(first_name,' ',last_name)"]),
+    ("course", "course", "course_id", "course_name", "course_code",
+     ["course_code", "course_name"]),
+    ("section", "section", "section_id", "section_code", "CONCAT(term,' ',year)",
+     ["section_code", "location"]),
+    ("department", "department", "department_id", "department_name", "office_location",
+     ["department_name", "office_location"]),
+]
+
+# Latency target for one global search round trip, in milliseconds.
+SEARCH_BUDGET_MS = 200
+
+def global_search(term, per_type=5):
+    """
+    Searches every entity type in one UNION ALL query. Matches are ranked
+    exact (3) > prefix (2) > substring (1) and limited to per_type rows each.
+    Returns (results grouped by entity type, elapsed milliseconds).
+    """
+    term = (term or "").strip()
+    grouped = {entry[0]: [] for entry in SEARCH_ENTITIES}
+    if not term:
+        return grouped, 0.0
+
+    escaped = db_manager.escape_like(term)
+    branches = []
+    params = []
+    for entity, table, id_col, label, detail, fields in SEARCH_ENTITIES:
+        exact = " OR ".join(f"{f} = %s" for f in fields)
+        prefix = " OR ".join(f"{f} LIKE %s" for f in fields)
+        where = " OR ".join(f"{f} LIKE %s" for f in fields)
+        score = f"CASE WHEN {exact} THEN 3 WHEN {prefix} THEN 2 ELSE 1 END"
+        branches.append(f"""(
+            SELECT %s AS entity_type, {score} AS score, {id_col} AS id,
+                   {label} AS label, {detail} AS detail
+            FROM {table}
+            WHERE {where}
+            ORDER BY score DESC, label, id
+            LIMIT %s
+        )""")
+        params += [entity]
+        params += [term] * len(fields)
+        params += [f"{escaped}%"] * len(fields)
+        params += [f"%{escaped}%"] * len(fields)
+        params += [per_type]
+
+    query = " UNION ALL ".join(branches)
+
+    start = time.perf_counter()
+    results = db_manager.query_rows(query, tuple(params))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if elapsed_ms > SEARCH_BUDGET_MS:
+        print(f"SEARCH SLOW: '{term}' took {elapsed_ms:.1f} ms (budget {SEARCH_BUDGET_MS} ms)")
+
+    if results:
+        for row in results:
+            grouped[row[0]].append({
+                "score": row[1],
+                "id": row[2],
+                "label": row[3],
+                "detail": row[4]
+            })
+        for rows in grouped.values():
+            rows.sort(key=lambda r: (-r["score"], str(r["label"])))
+
+    return grouped, elapsed_ms
+
+
+def transcript_filter(student_ids=None, major=None, cohort=None):
+    """
+    Builds the WHERE clause shared by the batch transcript queries. A cohort is
+    the year of a student's first enrolled section.
+    """
+    conditions = []
+    params = []
+    if student_ids:
+        conditions.append(f"st.student_id IN ({', '.join(['%s'] * len(student_ids))})")
+        params += list(student_ids)
+    if major:
+        conditions.append("st.major = %s")
+        params.append(major)
+    if cohort:
+        conditions.append("""st.student_id IN (
+            SELECT f.student_id
+            FROM (""" + history_union("""
+                SELECT e.student_id, MIN(s.year) AS first_year
+                FROM {enrollment} e
+                JOIN {section} s ON s.section_id = e.section_id
+                GROUP BY e.student_id
+            """) + """) f
+            GROUP BY f.student_id
+            HAVING MIN(f.first_year) = %s
+        )""")
+        params.append(cohort)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    return where, tuple(params)
+
+def batch_transcripts(student_ids=None, major=None, cohort=None):
+    """
+    Yields one transcript per student from a single streamed query ordered by
+    student and term, computing term and cumulative GPAs in one pass. Rows are
+    read in columnar chunks, so a full export never holds more than one chunk
+    of row data at a time.
+    """
+    where, params = transcript_filter(student_ids, major, cohort)
+    query = history_union(f"""
+    SELECT
+        st.student_id,
+        st.first_name,
+        st.last_name,
+        st.major,
+        c.course_code,
+        c.course_name,
+        c.credits,
+        s.term,
+        s.year,
+        e.grade,
+        e.quality_points,
+        FIELD(s.term, 'Spring', 'Summer', 'Fall') AS term_order
+    FROM student st
+    JOIN {{enrollment}} e ON e.student_id = st.student_id
+    JOIN {{section}} s ON s.section_id = e.section_id
+    JOIN course c ON c.course_id = s.course_id
+    {where}
+    """) + " ORDER BY student_id, year, term_order"
+
+    transcript = None
+    term = None
+    chunks = db_manager.iter_column_chunks(query, params * len(HISTORY_TABLES))
+    for row in (row for chunk in chunks for row in db_manager.column_rows(chunk)):
+        # Numeric columns come back as numbers of the column's storage kind
+        row = (int(row[0]),) + row[1:8] + (int(row[8]),) + row[9:]
+        if transcript is None or transcript["student_id"] != row[0]:
+            if transcript is not None:
+                yield finish_transcript(transcript)
+            transcript = {
+                "student_id": row[0],
+                "first_name": row[1],
+                "last_name": row[2],
+                "major": row[3],
+                "terms": [],
+                "points": 0.0,
+                "credits": 0.0
+            }
+            term = None
+
+        if term is None or (term["term"], term["year"]) != (row[7], row[8]):
+            term = {"term": row[7], "year": row[8], "courses": [], "points": 0.0, "credits": 0.0}
+            transcript["terms"].append(term)
+
+        credits = float(row[6])
+        grade = row[9]
+        # quality_points is stored as a float column, where NULL is NaN
+        if row[10] is not None and not math.isnan(row[10]):
+            points = float(row[10])
+            term["points"] += points * credits
+            term["credits"] += credits
+            transcript["points"] += points * credits
+            transcript["credits"] += credits
+
+        term["courses"].append({
+            "course_code": row[4],
+            "course_name": row[5],
+            "credits": credits,
+            "grade": grade
+        })
+
+    if transcript is not None:
+        yield finish_transcript(transcript)
+
+def finish_transcript(transcript):
+    """Replaces the running point and credit totals with rounded GPAs."""
+    for term in transcript["terms"]:
+        term["term_gpa"] = gpa(term.pop("points"), term.pop("credits"))
+    transcript["cumulative_gpa"] = gpa(transcript.pop("points"), transcript.pop("credits"))
+    return transcript
+
+def gpa(points, credits):
+    return round(points / credits, 2) if credits > 0 else None
+
+def transcript_page(page=1, per_page=50, major=None, cohort=None):
+    """
+    Returns one page of transcripts for students matching the filters, plus
+    whether another page follows. The page is None if the database failed.
+    """
+    where, params = transcript_filter(major=major, cohort=cohort)
+    ids = db_manager.query_rows(
+        f"SELECT st.student_id FROM student st{where} ORDER BY st.student_id LIMIT %s OFFSET %s",
+        params + (per_page + 1, (page - 1) * per_page))
+    if ids is None:
+        return None, False
+    if not ids:
+        return [], False
+
+    student_ids = [row[0] for row in ids[:per_page]]
+    try:
+        return list(batch_transcripts(student_ids=student_ids)), len(ids) > per_page
+    except Exception:
+        return None, False
+
+def timed_transcripts(transcripts, label="Transcripts"):
+    """Passes transcripts through and prints the throughput once exhausted."""
+    count = 0
+    start = time.perf_counter()
+    for transcript in transcripts:
+        count += 1
+        yield transcript
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"{label}: {count} in {elapsed:.2f}s ({rate:.1f} transcripts/sec)")
+
+def transcripts_json(transcripts):
+    """Streams transcripts as a JSON array, one chunk per transcript."""
+    yield "["
+    for i, transcript in enumerate(transcripts):
+        yield ("," if i else "") + json.dumps(transcript)
+    yield "]"
+
+TRANSCRIPT_CSV_COLUMNS = ["student_id", "first_name", "last_name", "major", "term", "year",
+                          "course_code", "course_name", "credits", "grade",
+                          "term_gpa", "cumulative_gpa"]
+
+def transcripts_csv(transcripts):
+    """Streams transcripts as CSV with one line per course taken."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(TRANSCRIPT_CSV_COLUMNS)
+    yield buffer.getvalue()
+    for transcript in transcripts:
+        buffer.seek(0)
+        buffer.truncate()
+        for term in transcript["terms"]:
+            for course in term["courses"]:
+                writer.writerow([
+                    transcript["student_id"], transcript["first_name"], transcript["last_name"],
+                    transcript["major"], term["term"], term["year"],
+                    course["course_code"], course["course_name"], course["credits"], course["grade"],
+                    term["term_gpa"], transcript["cumulative_gpa"]
+                ])
+        yield buffer.getvalue()
@@ -1,20 +1,206 @@
 import mysql.connector
+import mysql.connector.pooling
+from mysql.connector.constants import FieldType
+from array import array
+from collections import OrderedDict, namedtuple
 from dotenv import load_dotenv
 import os
+import sys
+import threading
+import shared_cache
 
 load_dotenv()
 
+DB_CONFIG = dict(
+    host=os.getenv("DB_HOST"),
+    user=os.getenv("DB_USER"),
+    password=os.getenv("DB_PASSWORD"),
+    database=os.getenv("DB_NAME")
+)
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 64))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    Creates the connection pool on first use in each process. A worker forked
+    after the pool was opened (gunicorn --preload) must not share the parent's
+    sockets, so it leaves them alone and opens its own.
+    """
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    # Threads racing on their first request would otherwise each open a pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # Sessions are not reset on return so server-side prepared statements
+            # survive between requests; leftover result sets are consumed instead.
+            _pool = mysql.connector.pooling.MySQLConnectionPool(
+                pool_name="academic",
+                pool_size=POOL_SIZE,
+                pool_reset_session=False,
+                consume_results=True,
+                **DB_CONFIG
+            )
+            _pool_pid = os.getpid()
+    return _pool
+
+def prewarm_pool():
+    """
+    Creates this process's pool now, which opens all of its connections up
+    front. Call it in each worker after the fork (see app.warm_worker).
+    """
+    try:
+        get_pool()
+        return True
+    except Exception as e:
+        print("DB POOL ERROR:", e)
+        return False
+
+def close_pool():
+    """
+    Closes this process's idle pooled connections and forgets the pool. Used
+    after warming up a process that goes on to fork workers, so it holds no
+    connections they could inherit.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            try:
+                _pool._remove_connections()
+            except Exception as e:
+                print("DB POOL ERROR:", e)
+        _pool = None
+        _pool_pid = None
+
 def get_db():
-    """Establishes connection to database."""
+    """Establishes connection to database, borrowing from the pool when possible."""
+    try:
+        return get_pool().get_connection()
+    except mysql.connector.errors.PoolError as e:
+        # Pool exhausted: fall back to a one-off connection
+        print("DB POOL EXHAUSTED:", e)
+    except Exception as e:
+        print("DB ERROR:", e)
+        return None
     try:
-        return mysql.connector.connect(
-            host=os.getenv("DB_HOST"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            database=os.getenv("DB_NAME")
-        )
+        return mysql.connector.connect(**DB_CONFIG)
+    except Exception as e:
+        print("DB ERROR:", e)
+        return None
+
+def release(db, discard=False):
+    """
+    Hands a connection back to the pool. Pooled sessions are not reset, so any
+    transaction a read left open is rolled back first; otherwise its snapshot
+    would hide later commits and its metadata locks would block DDL. With
+    discard=True (a failed batch that may have changed session settings such
+    as FOREIGN_KEY_CHECKS) the session is closed instead and the pool
+    reconnects it on next use.
+    """
+    if not discard:
+        try:
+            db.rollback()
+        except Exception:
+            discard = True
+    if discard:
+        try:
+            getattr(db, "_cnx", db).disconnect()
+        except Exception:
+            pass
+    try:
+        db.close()
     except Exception:
+        pass
+
+class StatementCache:
+    """
+    LRU cache of prepared cursors for one physical connection. Each cursor keeps
+    its statement prepared on the server, so repeated SQL shapes skip parsing.
+    """
+
+    def __init__(self, connection_id, size=STATEMENT_CACHE_SIZE):
+        self.connection_id = connection_id
+        self.size = size
+        self.entries = OrderedDict()
+
+    def get(self, db, sql):
+        """
+        Returns [prepared cursor, row type, sql] for sql, preparing it if needed.
+        The connector only skips re-preparing when it is given the very same
+        string object again, so callers must execute entry[2], not their own
+        (equal but new) copy of the query.
+        """
+        entry = self.entries.get(sql)
+        if entry:
+            self.entries.move_to_end(sql)
+            return entry
+        entry = [db.cursor(prepared=True), None, sql]
+        self.entries[sql] = entry
+        if len(self.entries) > self.size:
+            _, (old_cursor, _, _) = self.entries.popitem(last=False)
+            try:
+                old_cursor.close()
+            except Exception:
+                pass
+        return entry
+
+def statement_cache(db):
+    """
+    Returns the statement cache of a (pooled) connection. A reconnect gives the
+    connection a new server id, which discards the cache so it is rebuilt.
+    """
+    cnx = getattr(db, "_cnx", db)
+    cache = getattr(cnx, "statement_cache", None)
+    if cache is None or cache.connection_id != cnx.connection_id:
+        cache = StatementCache(cnx.connection_id)
+        cnx.statement_cache = cache
+    return cache
+
+def drop_statement_cache(db):
+    """Closes and forgets every cached statement after an error on db."""
+    cnx = getattr(db, "_cnx", db)
+    cache = getattr(cnx, "statement_cache", None)
+    if cache is None:
+        return
+    for cursor, _, _ in cache.entries.values():
+        try:
+            cursor.close()
+        except Exception:
+            pass
+    cnx.statement_cache = None
+
+def escape_like(term):
+    """Escapes LIKE wildcards so a user's term only matches itself."""
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def query_rows(query, params=None):
+    """
+    Executes a SELECT through a cached prepared statement and returns
+    lightweight named tuples, readable by index or by column name.
+    """
+    query = query.strip().rstrip(";")
+    db = get_db()
+    if not db:
         return None
+    try:
+        entry = statement_cache(db).get(db, query)
+        cursor = entry[0]
+        cursor.execute(entry[2], params or ())
+        rows = cursor.fetchall()
+        if entry[1] is None:
+            entry[1] = namedtuple("Row", cursor.column_names, rename=True)
+        return [entry[1]._make(row) for row in rows]
+    except Exception as e:
+        print("DB ERROR:", e)
+        drop_statement_cache(db)
+        return None
+    finally:
+        release(db)
 
 def query_all(query, params=None, dict_mode=False):
     """Executes a SELECT query and fetches all resulting rows."""
@@ -29,71 +215,595 @@ def query_all(query, params=None, dict_mode=False):
         print("DB ERROR:", e)
         return None
     finally:
-        try:
-            db.close()
-        except Exception:
-            pass
+        release(db)
 
 def query_dict(query, params=None):
     return query_all(query, params, dict_mode=True)
 
+def stream(query, params=None, batch_size=1000):
+    """
+    Yields the rows of a SELECT query without buffering the whole result,
+    fetching batch_size rows from the server at a time. Errors are raised
+    rather than ending the iteration, so a streamed response is aborted
+    instead of looking complete.
+    """
+    db = get_db()
+    if not db:
+        raise ConnectionError("could not connect to database")
+    try:
+        cursor = db.cursor()
+        cursor.execute(query, params or ())
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    except Exception as e:
+        print("DB STREAM ERROR:", e)
+        raise
+    finally:
+        release(db)
+
+# MySQL field types stored as numeric arrays by the columnar readers
+INT_TYPES = {FieldType.TINY, FieldType.SHORT, FieldType.INT24, FieldType.LONG,
+             FieldType.LONGLONG, FieldType.YEAR}
+FLOAT_TYPES = {FieldType.FLOAT, FieldType.DOUBLE, FieldType.DECIMAL, FieldType.NEWDECIMAL}
+STRING_TYPES = {FieldType.VARCHAR, FieldType.VAR_STRING, FieldType.STRING, FieldType.ENUM}
+
+def column_kinds(description):
+    """
+    Picks a storage kind per column: "int" for non-null integers, "float" for
+    other numbers (NULL becomes NaN), "str" for interned strings, "obj" otherwise.
+    """
+    kinds = []
+    for col in description:
+        type_code, null_ok = col[1], col[6]
+        if type_code in INT_TYPES:
+            kinds.append("float" if null_ok else "int")
+        elif type_code in FLOAT_TYPES:
+            kinds.append("float")
+        elif type_code in STRING_TYPES:
+            kinds.append("str")
+        else:
+            kinds.append("obj")
+    return kinds
+
+def to_columns(rows, kinds, columns=None):
+    """Appends a batch of row tuples onto per-column storage."""
+    if columns is None:
+        columns = [array("q") if k == "int" else array("d") if k == "float" else []
+                   for k in kinds]
+    nan = float("nan")
+    intern = sys.intern
+    for i, (kind, values) in enumerate(zip(kinds, zip(*rows))):
+        if kind == "int":
+            columns[i].extend(values)
+        elif kind == "float":
+            columns[i].extend(nan if v is None else float(v) for v in values)
+        elif kind == "str":
+            columns[i].extend(intern(v) if type(v) is str else v for v in values)
+        else:
+            columns[i].extend(values)
+    return columns
+
+def finish_columns(names, columns):
+    """Maps column names to storage, converting arrays to NumPy when installed."""
+    # Imported here rather than at module level to keep NumPy off app startup
+    try:
+        import numpy as np
+    except ImportError:  # columnar reads fall back to array.array
+        np = None
+    if np is not None:
+        columns = [np.frombuffer(c, dtype=np.int64 if c.typecode == "q" else np.float64)
+                   if isinstance(c, array) else c for c in columns]
+    return dict(zip(names, columns))
+
+def iter_column_chunks(query, params=None, chunk_rows=50000, batch_size=5000):
+    """
+    Streams a SELECT as a series of {column name: column} chunks of about
+    chunk_rows rows each (whole fetchmany batches of batch_size rows).
+    Numbers go into array/NumPy columns and strings into interned lists, so
+    no per-row Python objects are kept. Errors are raised, like stream(), so a
+    failure never passes for a shorter but complete result.
+    """
+    db = get_db()
+    if not db:
+        raise ConnectionError("could not connect to database")
+    try:
+        cursor = db.cursor()
+        cursor.execute(query, params or ())
+        names = cursor.column_names
+        kinds = column_kinds(cursor.description)
+        columns, count = None, 0
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if rows:
+                columns = to_columns(rows, kinds, columns)
+                count += len(rows)
+            if columns is not None and (not rows or count >= chunk_rows):
+                yield finish_columns(names, columns)
+                columns, count = None, 0
+            if not rows:
+                break
+    except Exception as e:
+        print("DB COLUMNS ERROR:", e)
+        raise
+    finally:
+        release(db)
+
+def column_rows(chunk):
+    """Yields the rows of a column chunk as tuples of plain Python values."""
+    return zip(*[c.tolist() if hasattr(c, "tolist") else c for c in chunk.values()])
+
+def query_columns(query, params=None, batch_size=5000):
+    """Fetches a whole SELECT into a single {column name: column} mapping."""
+    db = get_db()
+    if not db:
+        return None
+    try:
+        cursor = db.cursor()
+        cursor.execute(query, params or ())
+        names = cursor.column_names
+        kinds = column_kinds(cursor.description)
+        columns = to_columns([], kinds)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            to_columns(rows, kinds, columns)
+        return finish_columns(names, columns)
+    except Exception as e:
+        print("DB COLUMNS ERROR:", e)
+        return None
+    finally:
+        release(db)
+
 def execute(query, params=None):
     """Run a single modifying statement (INSERT/UPDATE/DELETE)."""
+    query = query.strip().rstrip(";")
     db = get_db()
     if not db:
         return False
     try:
-        cursor = db.cursor()
-        cursor.execute(query, params or ())
+        entry = statement_cache(db).get(db, query)
+        entry[0].execute(entry[2], params or ())
         db.commit()
+        shared_cache.invalidate()
         return True
     except Exception as e:
         print("DB EXEC ERROR:", e)
+        drop_statement_cache(db)
         try:
             db.rollback()
         except Exception:
             pass
         return False
     finally:
-        try:
-            db.close()
-        except Exception:
-            pass
+        release(db)
 
 def execute_many(sql_list_with_params):
     """Execute a list of (sql, params) tuples in one DB transaction."""
     db = get_db()
     if not db:
         return False
+    failed = False
     try:
         cursor = db.cursor()
         for sql, params in sql_list_with_params:
             cursor.execute(sql, params or ())
         db.commit()
+        shared_cache.invalidate()
         return True
     except Exception as e:
         print("DB MULTI ERROR:", e)
+        failed = True
         try:
             db.rollback()
         except Exception:
             pass
         return False
     finally:
-        try:
-            db.close()
-        except Exception:
-            pass
+        # A batch can change session settings (reset_tables turns off
+        # FOREIGN_KEY_CHECKS), so a failed one must not go back to the pool as is
+        release(db, discard=failed)
+
+def current_year():
+    """Returns the latest year with live sections."""
+    rows = query_rows("SELECT MAX(year) FROM section")
+    return rows[0][0] if rows else None
+
+def archive_term(term, year):
+    """
+    Moves a finished term's sections and their enrollments from the live tables
+    into section_archive/enrollment_archive in one transaction. Transcript and
+    GPA queries read both tables; the change log records the moved rows as
+    ARCHIVE rather than DELETE. Returns the number of sections moved, 0 if the
+    term has none, or None on error.
+    """
+    rows = query_rows("SELECT COUNT(*) FROM section WHERE term = %s AND year = %s", (term, year))
+    if not rows:
+        return None
+    if rows[0][0] == 0:
+        return 0
+    match = "WHERE s.term = %s AND s.year = %s"
+    ok = execute_many([
+        (f"INSERT INTO section_archive SELECT s.* FROM section s {match}", (term, year)),
+        (f"""INSERT INTO enrollment_archive SELECT e.* FROM enrollment e
+             JOIN section s ON s.section_id = e.section_id {match}""", (term, year)),
+        (f"""DELETE e FROM enrollment e
+             JOIN section s ON s.section_id = e.section_id {match}""", (term, year)),
+        (f"DELETE s FROM section s {match}", (term, year)),
+    ])
+    return rows[0][0] if ok else None
+
+# Quality points per letter grade. Seeded into grade_scale, which is the single
+# source the enrollment.quality_points triggers read from.
+GRADE_SCALE = {
+    'A': 4.0, 'A-': 3.7,
+    'B+': 3.3, 'B': 3.0, 'B-': 2.7,
+    'C+': 2.3, 'C': 2.0, 'C-': 1.7,
+    'D+': 1.3, 'D': 1.0, 'F': 0.0
+}
+
+def refresh_quality_points():
+    """Recomputes quality_points, live and archived, after grade_scale has been edited."""
+    return execute_many([(f"""
+        UPDATE {table} e
+        LEFT JOIN grade_scale g ON g.grade = e.grade
+        SET e.quality_points = g.points
+    """, None) for table in ("enrollment", "enrollment_archive")])
+
+# Primary key and data columns of every table tracked by the change log.
+TRACKED_TABLES = {
+    "department": ("department_id", ["chair_id", "department_name", "office_location"]),
+    "student": ("student_id", ["first_name", "last_name", "email", "major", "date_of_birth"]),
+    "instructor": ("instructor_id", ["department_id", "first_name", "last_name", "email"]),
+    "course": ("course_id", ["department_id", "course_name", "course_code", "credits"]),
+    "section": ("section_id", ["course_id", "instructor_id", "section_code", "term", "year",
+                               "time", "days", "capacity", "location"]),
+    "enrollment": ("enrollment_id", ["student_id", "section_id", "grade"]),
+}
+
+# Tracked tables that archive_term moves rows out of
+ARCHIVED_TABLES = {"section", "enrollment"}
+
+def log_change(table, entity_id, operation, changed_columns):
+    """
+    Trigger statements appending one change_log entry. The seq comes from the
+    change_seq counter row, whose lock is held until commit, so entries become
+    visible in seq order and a consumer never skips a seq that commits late.
+    """
+    return f"""
+        UPDATE change_seq SET last_seq = LAST_INSERT_ID(last_seq + 1) WHERE id = 1;
+        INSERT INTO change_log (seq, entity, entity_id, operation, changed_columns)
+        VALUES (LAST_INSERT_ID(), '{table}', {entity_id}, {operation}, {changed_columns});"""
+
+def change_log_triggers():
+    """
+    Builds the AFTER INSERT/UPDATE/DELETE triggers that append to change_log.
+    Triggers run inside the writing transaction, so a rolled back write leaves
+    no entry. Note that InnoDB foreign key cascades do not fire triggers, which
+    is why the delete routes clear child rows explicitly. A delete whose row
+    already sits in the archive table was a move by archive_term and is logged
+    as ARCHIVE; the delete routes clear archived rows first, so theirs are not.
+    Deleting an archived row later is logged as a DELETE of the same entity.
+    """
+    statements = []
+    for table, (pk, columns) in TRACKED_TABLES.items():
+        all_columns = ",".join(columns)
+        diff = ", ".join(f"IF(OLD.{c} <=> NEW.{c}, NULL, '{c}')" for c in columns)
+        delete_op = "'DELETE'"
+        if table in ARCHIVED_TABLES:
+            delete_op = (f"IF(EXISTS (SELECT 1 FROM {table}_archive WHERE {pk} = OLD.{pk}), "
+                         f"'ARCHIVE', 'DELETE')")
+        statements += [
+            f"""CREATE TRIGGER {table}_log_insert AFTER INSERT ON {table} FOR EACH ROW
+                BEGIN
+                    {log_change(table, f"NEW.{pk}", "'INSERT'", f"'{all_columns}'")}
+                END""",
+            f"""CREATE TRIGGER {table}_log_update AFTER UPDATE ON {table} FOR EACH ROW
+                BEGIN
+                    DECLARE cols VARCHAR(255);
+                    SET cols = CONCAT_WS(',', {diff});
+                    IF cols <> '' THEN
+                        {log_change(table, f"NEW.{pk}", "'UPDATE'", "cols")}
+                    END IF;
+                END""",
+            f"""CREATE TRIGGER {table}_log_delete AFTER DELETE ON {table} FOR EACH ROW
+                BEGIN
+                    {log_change(table, f"OLD.{pk}", delete_op, "NULL")}
+                END""",
+        ]
+        if table in ARCHIVED_TABLES:
+            statements.append(
+                f"""CREATE TRIGGER {table}_archive_log_delete AFTER DELETE ON {table}_archive FOR EACH ROW
+                    BEGIN
+                        {log_change(table, f"OLD.{pk}", "'DELETE'", "NULL")}
+                    END""")
+    return statements
+
+def changes_since(seq, limit=1000):
+    """
+    Returns up to `limit` change_log entries with a sequence number above `seq`,
+    oldest first. Consumers pass the last seq they saw to fetch the next batch.
+    """
+    return query_dict("""
+        SELECT seq, entity, entity_id, operation, changed_columns, changed_at
+        FROM change_log
+        WHERE seq > %s
+        ORDER BY seq
+        LIMIT %s
+    """, (seq, limit))
+
+# Denormalized read models behind the /enrollments and /sections pages. Rows are
+# kept current by triggers on the base tables; the SELECTs below rebuild them
+# in bulk and list columns in table order.
+ROSTER_SELECT = """
+    SELECT e.enrollment_id, e.student_id, e.section_id, c.course_id,
+           CONCAT(st.first_name,' ',st.last_name), c.course_code, c.course_name, e.grade,
+           st.last_name
+    FROM enrollment e
+    JOIN student st ON st.student_id = e.student_id
+    JOIN section se ON se.section_id = e.section_id
+    JOIN course c ON c.course_id = se.course_id
+"""
+
+LISTING_SELECT = """
+    SELECT s.section_id, s.course_id, s.instructor_id, c.course_code, s.section_code,
+           s.term, s.year, s.days, s.time, s.location,
+           CONCAT(i.first_name,' ',i.last_name), i.last_name
+    FROM section s
+    JOIN course c ON c.course_id = s.course_id
+    LEFT JOIN instructor i ON i.instructor_id = s.instructor_id
+"""
+
+def read_model_triggers():
+    """
+    Builds the triggers that keep enrollment_roster and section_listing in step
+    with the base tables. Deletes are handled on the parent tables as well,
+    because foreign key cascades do not fire the child tables' triggers.
+    """
+    refresh_roster = """REPLACE INTO enrollment_roster
+        SELECT NEW.enrollment_id, NEW.student_id, NEW.section_id, c.course_id,
+               CONCAT(st.first_name,' ',st.last_name), c.course_code, c.course_name, NEW.grade,
+               st.last_name
+        FROM student st
+        JOIN section se ON se.section_id = NEW.section_id
+        JOIN course c ON c.course_id = se.course_id
+        WHERE st.student_id = NEW.student_id"""
+    refresh_listing = """REPLACE INTO section_listing
+        SELECT NEW.section_id, NEW.course_id, NEW.instructor_id, c.course_code, NEW.section_code,
+               NEW.term, NEW.year, NEW.days, NEW.time, NEW.location,
+               CONCAT(i.first_name,' ',i.last_name), i.last_name
+        FROM course c
+        LEFT JOIN instructor i ON i.instructor_id = NEW.instructor_id
+        WHERE c.course_id = NEW.course_id"""
+    return [
+        f"CREATE TRIGGER enrollment_roster_insert AFTER INSERT ON enrollment FOR EACH ROW {refresh_roster}",
+        f"CREATE TRIGGER enrollment_roster_update AFTER UPDATE ON enrollment FOR EACH ROW {refresh_roster}",
+        """CREATE TRIGGER enrollment_roster_delete AFTER DELETE ON enrollment FOR EACH ROW
+            DELETE FROM enrollment_roster WHERE enrollment_id = OLD.enrollment_id""",
+        """CREATE TRIGGER student_roster_update AFTER UPDATE ON student FOR EACH ROW
+            UPDATE enrollment_roster
+            SET student_name = CONCAT(NEW.first_name,' ',NEW.last_name), student_last_name = NEW.last_name
+            WHERE student_id = NEW.student_id""",
+        """CREATE TRIGGER student_roster_delete AFTER DELETE ON student FOR EACH ROW
+            DELETE FROM enrollment_roster WHERE student_id = OLD.student_id""",
+        f"CREATE TRIGGER section_listing_insert AFTER INSERT ON section FOR EACH ROW {refresh_listing}",
+        f"""CREATE TRIGGER section_listing_update AFTER UPDATE ON section FOR EACH ROW
+            BEGIN
+                {refresh_listing};
+                UPDATE enrollment_roster r
+                JOIN course c ON c.course_id = NEW.course_id
+                SET r.course_id = c.course_id, r.course_code = c.course_code, r.course_name = c.course_name
+                WHERE r.section_id = NEW.section_id;
+            END""",
+        """CREATE TRIGGER section_listing_delete AFTER DELETE ON section FOR EACH ROW
+            BEGIN
+                DELETE FROM section_listing WHERE section_id = OLD.section_id;
+                DELETE FROM enrollment_roster WHERE section_id = OLD.section_id;
+            END""",
+        """CREATE TRIGGER course_read_model_update AFTER UPDATE ON course FOR EACH ROW
+            BEGIN
+                UPDATE section_listing SET course_code = NEW.course_code
+                WHERE course_id = NEW.course_id;
+                UPDATE enrollment_roster SET course_code = NEW.course_code, course_name = NEW.course_name
+                WHERE course_id = NEW.course_id;
+            END""",
+        """CREATE TRIGGER course_read_model_delete AFTER DELETE ON course FOR EACH ROW
+            BEGIN
+                DELETE FROM section_listing WHERE course_id = OLD.course_id;
+                DELETE FROM enrollment_roster WHERE course_id = OLD.course_id;
+            END""",
+        """CREATE TRIGGER instructor_listing_update AFTER UPDATE ON instructor FOR EACH ROW
+            UPDATE section_listing
+            SET instructor = CONCAT(NEW.first_name,' ',NEW.last_name), instructor_last_name = NEW.last_name
+            WHERE instructor_id = NEW.instructor_id""",
+        """CREATE TRIGGER instructor_listing_delete AFTER DELETE ON instructor FOR EACH ROW
+            UPDATE section_listing SET instructor_id = NULL, instructor = NULL, instructor_last_name = NULL
+            WHERE instructor_id = OLD.instructor_id""",
+    ]
+
+def rebuild_read_models():
+    """Repopulates enrollment_roster and section_listing from the base tables."""
+    return execute_many([
+        ("DELETE FROM enrollment_roster", None),
+        (f"INSERT INTO enrollment_roster {ROSTER_SELECT}", None),
+        ("DELETE FROM section_listing", None),
+        (f"INSERT INTO section_listing {LISTING_SELECT}", None),
+    ])
+
+def derived_schema(upgrade=False):
+    """
+    Statements creating everything layered on the six base tables: archive
+    tables and history views, grade_scale, the change log, the read models and
+    enrollment_request, with their triggers. With upgrade=True every statement
+    is safe on an existing database: tables are created only if missing, views
+    and triggers are replaced, and the read models (derived data) are dropped
+    so they come back with the current columns.
+    """
+    table = "CREATE TABLE IF NOT EXISTS" if upgrade else "CREATE TABLE"
+    view = "CREATE OR REPLACE VIEW" if upgrade else "CREATE VIEW"
+
+    def triggers(statements):
+        if not upgrade:
+            return statements
+        replaced = []
+        for statement in statements:
+            name = statement.split()[2]
+            replaced += [f"DROP TRIGGER IF EXISTS {name}", statement]
+        return replaced
+
+    read_model_drops = ["DROP TABLE IF EXISTS enrollment_roster",
+                        "DROP TABLE IF EXISTS section_listing"] if upgrade else []
+
+    return [
+        # Archive tables copy columns and indexes but not foreign keys or triggers
+        f"{table} section_archive LIKE section",
+        f"{table} enrollment_archive LIKE enrollment",
+        # Convenience views for ad-hoc queries. MySQL materializes UNION ALL
+        # views, so application queries expand complex.history_union instead.
+        f"""{view} section_history AS
+            SELECT * FROM section UNION ALL SELECT * FROM section_archive""",
+        f"""{view} enrollment_history AS
+            SELECT * FROM enrollment UNION ALL SELECT * FROM enrollment_archive""",
+        f"""{table} grade_scale (
+            grade CHAR(2) PRIMARY KEY,
+            points DECIMAL(2,1) NOT NULL
+        )""",
+        *triggers([
+            """CREATE TRIGGER enrollment_points_insert BEFORE INSERT ON enrollment FOR EACH ROW
+            SET NEW.quality_points = (SELECT points FROM grade_scale WHERE grade = NEW.grade)""",
+            """CREATE TRIGGER enrollment_points_update BEFORE UPDATE ON enrollment FOR EACH ROW
+            SET NEW.quality_points = (SELECT points FROM grade_scale WHERE grade = NEW.grade)""",
+        ]),
+        f"""{table} change_log (
+            seq BIGINT PRIMARY KEY,
+            entity VARCHAR(30) NOT NULL,
+            entity_id INT NOT NULL,
+            operation VARCHAR(7) NOT NULL,
+            changed_columns VARCHAR(255),
+            changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )""",
+        f"""{table} change_seq (
+            id TINYINT PRIMARY KEY,
+            last_seq BIGINT NOT NULL
+        )""",
+        # Continues after any entries an existing change_log already holds
+        """INSERT IGNORE INTO change_seq (id, last_seq)
+            SELECT 1, COALESCE(MAX(seq), 0) FROM change_log""",
+        *triggers(change_log_triggers()),
+        *read_model_drops,
+        f"""{table} enrollment_roster (
+            enrollment_id INT PRIMARY KEY,
+            student_id INT NOT NULL,
+            section_id INT NOT NULL,
+            course_id INT NOT NULL,
+            student_name VARCHAR(101) NOT NULL,
+            course_code VARCHAR(10) NOT NULL,
+            course_name VARCHAR(100) NOT NULL,
+            grade CHAR(2),
+            student_last_name VARCHAR(50) NOT NULL,
+            INDEX idx_roster_student_name (student_name),
+            INDEX idx_roster_student_last_name (student_last_name),
+            INDEX idx_roster_course_code (course_code),
+            INDEX idx_roster_course_name (course_name),
+            INDEX idx_roster_grade (grade),
+            INDEX idx_roster_student (student_id),
+            INDEX idx_roster_section (section_id),
+            INDEX idx_roster_course (course_id)
+        )""",
+        f"""{table} section_listing (
+            section_id INT PRIMARY KEY,
+            course_id INT NOT NULL,
+            instructor_id INT,
+            course_code VARCHAR(10) NOT NULL,
+            section_code VARCHAR(15) NOT NULL,
+            term VARCHAR(10) NOT NULL,
+            year INT NOT NULL,
+            days VARCHAR(50),
+            time VARCHAR(20),
+            location VARCHAR(50),
+            instructor VARCHAR(101),
+            instructor_last_name VARCHAR(50),
+            INDEX idx_listing_course_code (course_code),
+            INDEX idx_listing_section_code (section_code),
+            INDEX idx_listing_instructor (instructor),
+            INDEX idx_listing_instructor_last_name (instructor_last_name),
+            INDEX idx_listing_term (year, term),
+            INDEX idx_listing_course (course_id),
+            INDEX idx_listing_instructor_id (instructor_id)
+        )""",
+        *triggers(read_model_triggers()),
+        f"""{table} enrollment_request (
+            ticket VARCHAR(40) PRIMARY KEY,
+            status VARCHAR(10) NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_request_updated (updated_at)
+        )""",
+    ]
+
+def grade_scale_seed():
+    return [("INSERT IGNORE INTO grade_scale (grade, points) VALUES (%s, %s)", item)
+            for item in GRADE_SCALE.items()]
+
+def upgrade_schema():
+    """
+    Brings a database created by an older reset_tables up to the current
+    schema without losing data: adds the enrollment.quality_points column and
+    the newer indexes to the base tables, creates whatever derived_schema
+    objects are missing, then backfills quality points and the read models.
+    """
+    columns = query_all("""
+        SELECT table_name, column_name FROM information_schema.columns
+        WHERE table_schema = DATABASE()""")
+    indexes = query_all("""
+        SELECT DISTINCT table_name, index_name FROM information_schema.statistics
+        WHERE table_schema = DATABASE()""")
+    if columns is None or indexes is None:
+        return False
+    columns = {(t.lower(), c.lower()) for t, c in columns}
+    indexes = {(t.lower(), i.lower()) for t, i in indexes}
+    if ("enrollment", "enrollment_id") not in columns:
+        print("DB ERROR: no base tables to upgrade; run reset_tables instead")
+        return False
+
+    commands = []
+    if ("enrollment", "quality_points") not in columns:
+        commands.append("ALTER TABLE enrollment ADD COLUMN quality_points DECIMAL(2,1)")
+    if ("enrollment", "idx_enrollment_points") not in indexes:
+        commands.append("ALTER TABLE enrollment ADD INDEX idx_enrollment_points "
+                        "(student_id, section_id, quality_points)")
+    if ("section", "idx_section_year") not in indexes:
+        commands.append("ALTER TABLE section ADD INDEX idx_section_year (year, term)")
+    if ("change_log", "operation") in columns:
+        commands.append("ALTER TABLE change_log MODIFY operation VARCHAR(7) NOT NULL")
+    commands += derived_schema(upgrade=True)
+
+    return (execute_many([(cmd, None) for cmd in commands] + grade_scale_seed())
+            and refresh_quality_points()
+            and rebuild_read_models())
 
 def reset_tables():
     """Executes table schema, wiping all records."""
     commands = [
         "SET FOREIGN_KEY_CHECKS = 0",
+        "DROP VIEW IF EXISTS enrollment_history",
+        "DROP VIEW IF EXISTS section_history",
+        "DROP TABLE IF EXISTS enrollment_archive",
+        "DROP TABLE IF EXISTS section_archive",
         "DROP TABLE IF EXISTS enrollment",
         "DROP TABLE IF EXISTS section",
         "DROP TABLE IF EXISTS course",
         "DROP TABLE IF EXISTS instructor",
         "DROP TABLE IF EXISTS student",
         "DROP TABLE IF EXISTS department",
+        "DROP TABLE IF EXISTS change_log",
+        "DROP TABLE IF EXISTS change_seq",
+        "DROP TABLE IF EXISTS grade_scale",
+        "DROP TABLE IF EXISTS enrollment_roster",
+        "DROP TABLE IF EXISTS section_listing",
+        "DROP TABLE IF EXISTS enrollment_request",
         """CREATE TABLE department (
             department_id INT PRIMARY KEY AUTO_INCREMENT,
             chair_id INT,
@@ -137,6 +847,7 @@ def reset_tables():
             days VARCHAR(50),
             capacity INT NOT NULL,
             location VARCHAR(50),
+            INDEX idx_section_year (year, term),
             FOREIGN KEY (course_id) REFERENCES course(course_id)
                 ON DELETE CASCADE,
             FOREIGN KEY (instructor_id) REFERENCES instructor(instructor_id)
@@ -147,14 +858,17 @@ def reset_tables():
             student_id INT NOT NULL,
             section_id INT NOT NULL,
             grade CHAR(2),
+            quality_points DECIMAL(2,1),
+            INDEX idx_enrollment_points (student_id, section_id, quality_points),
             FOREIGN KEY (student_id) REFERENCES student(student_id)
                 ON DELETE CASCADE,
             FOREIGN KEY (section_id) REFERENCES section(section_id)
                 ON DELETE CASCADE
 
         )""",
+        *derived_schema(),
         "SET FOREIGN_KEY_CHECKS = 1"
     ]
 
     # Execute all
-    return execute_many([(cmd, None) for cmd in commands])
\ No newline at end of file
+    return execute_many([(cmd, None) for cmd in commands] + grade_scale_seed())
\ No newline at end of file
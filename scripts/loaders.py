@@ -0,0 +1,179 @@
+from flask import g
+import db_manager
+
+# Batching data loaders. Keys requested while rendering a page are collected and
+# resolved with one IN (...) query per loader, and every result is cached for
+# the rest of the request, so a page costs the same number of queries no matter
+# how many parent rows it shows.
+
+class DataLoader:
+    def __init__(self, batch_fn, default=None):
+        self.batch_fn = batch_fn
+        self.default = default
+        self.cache = {}
+        self.pending = set()
+        self.queries = 0
+
+    def prime(self, keys):
+        """Queues keys to be fetched by the next dispatch."""
+        self.pending.update(k for k in keys if k not in self.cache)
+
+    def dispatch(self):
+        """Resolves every queued key with a single batch query."""
+        if not self.pending:
+            return
+        keys = sorted(self.pending)
+        self.pending.clear()
+        results = self.batch_fn(keys) or {}
+        self.queries += 1
+        for key in keys:
+            self.cache[key] = results.get(key, self.default() if callable(self.default) else self.default)
+
+    def load(self, key):
+        if key not in self.cache:
+            self.pending.add(key)
+            self.dispatch()
+        return self.cache[key]
+
+    def load_many(self, keys):
+        keys = list(keys)
+        self.prime(keys)
+        self.dispatch()
+        return [self.cache[k] for k in keys]
+
+
+def in_clause(keys):
+    return ", ".join(["%s"] * len(keys))
+
+def group_rows(rows, key):
+    grouped = {}
+    for row in rows or []:
+        grouped.setdefault(row[key], []).append(row)
+    return grouped
+
+def roster_by_section(section_ids):
+    return group_rows(db_manager.query_dict(f"""
+        SELECT e.section_id, st.student_id, st.first_name, st.last_name, st.email, e.grade
+        FROM enrollment e
+        JOIN student st ON st.student_id = e.student_id
+        WHERE e.section_id IN ({in_clause(section_ids)})
+        ORDER BY st.last_name, st.first_name
+    """, tuple(section_ids)), "section_id")
+
+def headcount_by_section(section_ids):
+    rows = db_manager.query_all(f"""
+        SELECT section_id, COUNT(*)
+        FROM enrollment
+        WHERE section_id IN ({in_clause(section_ids)})
+        GROUP BY section_id
+    """, tuple(section_ids))
+    return {row[0]: row[1] for row in rows or []}
+
+def sections_by_instructor(instructor_ids):
+    return group_rows(db_manager.query_dict(f"""
+        SELECT s.instructor_id, s.section_id, s.section_code, s.term, s.year,
+               s.capacity, c.course_code, c.credits
+        FROM section s
+        JOIN course c ON c.course_id = s.course_id
+        WHERE s.instructor_id IN ({in_clause(instructor_ids)})
+        ORDER BY s.section_code
+    """, tuple(instructor_ids)), "instructor_id")
+
+def sections_by_course(course_ids):
+    return group_rows(db_manager.query_dict(f"""
+        SELECT s.course_id, s.section_id, s.section_code, s.term, s.year, s.capacity,
+               CONCAT(i.first_name,' ',i.last_name) AS instructor
+        FROM section s
+        LEFT JOIN instructor i ON i.instructor_id = s.instructor_id
+        WHERE s.course_id IN ({in_clause(course_ids)})
+        ORDER BY s.section_code
+    """, tuple(course_ids)), "course_id")
+
+def courses_by_department(department_ids):
+    return group_rows(db_manager.query_dict(f"""
+        SELECT department_id, course_id, course_code, course_name, credits
+        FROM course
+        WHERE department_id IN ({in_clause(department_ids)})
+        ORDER BY course_code
+    """, tuple(department_ids)), "department_id")
+
+def instructors_by_department(department_ids):
+    return group_rows(db_manager.query_dict(f"""
+        SELECT department_id, instructor_id, first_name, last_name, email
+        FROM instructor
+        WHERE department_id IN ({in_clause(department_ids)})
+        ORDER BY last_name, first_name
+    """, tuple(department_ids)), "department_id")
+
+
+class RequestLoaders:
+    """One set of loaders and one identity cache per Flask request."""
+
+    def __init__(self):
+        self.roster = DataLoader(roster_by_section, default=list)
+        self.headcount = DataLoader(headcount_by_section, default=0)
+        self.instructor_sections = DataLoader(sections_by_instructor, default=list)
+        self.course_sections = DataLoader(sections_by_course, default=list)
+        self.department_courses = DataLoader(courses_by_department, default=list)
+        self.department_instructors = DataLoader(instructors_by_department, default=list)
+        self.root_queries = 0
+
+    def query_dict(self, query, params=None):
+        """Runs a page's root query so it is included in the query count."""
+        self.root_queries += 1
+        return db_manager.query_dict(query, params) or []
+
+    @property
+    def queries(self):
+        loaders = [v for v in vars(self).values() if isinstance(v, DataLoader)]
+        return self.root_queries + sum(l.queries for l in loaders)
+
+def get_loaders():
+    if "loaders" not in g:
+        g.loaders = RequestLoaders()
+    return g.loaders
+
+
+def benchmark(sizes=(10, 100, 1000)):
+    """
+    Loads rosters, headcounts and instructor sections for growing numbers of
+    parent rows, once through the loaders and once with a query per row, and
+    checks that the loaders' query count stays the same at every size.
+    """
+    import time
+
+    section_ids = [r[0] for r in db_manager.query_all(
+        "SELECT section_id FROM section ORDER BY section_id") or []]
+    instructor_ids = [r[0] for r in db_manager.query_all(
+        "SELECT instructor_id FROM instructor ORDER BY instructor_id") or []]
+    if not section_ids or not instructor_ids:
+        raise SystemExit("Seed the database first (Reset & Populate Database).")
+
+    counts = []
+    for n in sizes:
+        sections, instructors = section_ids[:n], instructor_ids[:n]
+
+        start = time.perf_counter()
+        ld = RequestLoaders()
+        ld.roster.load_many(sections)
+        ld.headcount.load_many(sections)
+        ld.instructor_sections.load_many(instructors)
+        batched_ms = (time.perf_counter() - start) * 1000
+        counts.append(ld.queries)
+
+        start = time.perf_counter()
+        for section_id in sections:
+            roster_by_section([section_id])
+            headcount_by_section([section_id])
+        for instructor_id in instructors:
+            sections_by_instructor([instructor_id])
+        per_row_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{len(sections):>5} sections, {len(instructors):>4} instructors: "
+              f"loaders {ld.queries} queries in {batched_ms:.1f} ms, "
+              f"per row {2 * len(sections) + len(instructors)} queries in {per_row_ms:.1f} ms")
+
+    assert len(set(counts)) == 1, f"loader query count grew with the rows loaded: {counts}"
+
+if __name__ == "__main__":
+    benchmark()
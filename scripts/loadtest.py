@@ -0,0 +1,292 @@
+# Load generator simulating registration-week traffic against the Flask app.
+#
+# Drives app.py routes with a weighted mix of list browsing (random sort, order
+# and search), report/transcript lookups, the loader-backed roster, load and
+# department pages, global /search queries and bursts of add/delete enrollment,
+# using ids drawn from the seeded database. Concurrency ramps up step by step
+# and each step reports throughput, latency percentiles, error rate and the
+# number of MySQL connections. `python loaders.py` checks that the loader
+# pages' query count stays constant as the number of rows grows.
+#
+#     python loadtest.py                                  # against http://localhost:5000
+#     python loadtest.py --in-process                     # no server, uses app.test_client()
+#     python loadtest.py --steps 1,4,16,64 --duration 20 --mix browse=50,report=20,write=30
+import argparse
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector
+import db_manager
+
+LIST_PAGES = {
+    "/students": ["student_id", "first_name", "last_name", "email", "major", "date_of_birth"],
+    "/instructors": ["instructor_id", "first_name", "last_name", "email", "department_name"],
+    "/courses": ["course_id", "course_code", "course_name", "credits", "department_name"],
+    "/departments": ["department_id", "department_name", "office_location", "chair_name"],
+    "/sections": ["section_id", "course_code", "section_code", "term", "year", "instructor"],
+    "/enrollments": ["enrollment_id", "student_name", "course_code", "course_name", "grade"],
+}
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(NoRedirect)
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=30) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except Exception:
+            return 0
+
+class InProcessClient:
+    def __init__(self):
+        from app import app
+        self.app = app
+
+    def request(self, method, path, data=None):
+        with self.app.test_client() as client:
+            try:
+                return client.open(path, method=method, data=data).status_code
+            except Exception:
+                return 0
+
+class Database:
+    """
+    The load generator's own single connection, used for seeding, sampling and
+    cleanup. Going through db_manager would open a whole pool in this process
+    and inflate the server's connection count; this adds exactly one.
+    """
+
+    def __init__(self):
+        self.cnx = mysql.connector.connect(autocommit=True, **db_manager.DB_CONFIG)
+        self.lock = threading.Lock()
+
+    def rows(self, query, params=None):
+        with self.lock:
+            cursor = self.cnx.cursor()
+            try:
+                cursor.execute(query, params or ())
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+
+    def run(self, query, params=None):
+        with self.lock:
+            cursor = self.cnx.cursor()
+            try:
+                cursor.execute(query, params or ())
+            finally:
+                cursor.close()
+
+class SeedData:
+    """Ids and search terms sampled from the seeded database."""
+
+    def __init__(self, db):
+        self.student_ids = [r[0] for r in db.rows("SELECT student_id FROM student")]
+        self.section_ids = [r[0] for r in db.rows("SELECT section_id FROM section")]
+        self.department_ids = [r[0] for r in db.rows("SELECT department_id FROM department")]
+        self.terms = [r[0] for r in db.rows("SELECT DISTINCT last_name FROM student LIMIT 200")]
+        self.terms += [r[0] for r in db.rows("SELECT course_code FROM course")]
+        self.baseline_enrollment = db.rows("SELECT MAX(enrollment_id) FROM enrollment")[0][0] or 0
+        self.started_at = db.rows("SELECT NOW()")[0][0]
+        self.next_delete = self.baseline_enrollment + 1
+        self.lock = threading.Lock()
+        if not self.student_ids or not self.section_ids:
+            raise SystemExit("Seed the database first (Reset & Populate Database).")
+
+    def take_delete_id(self):
+        # Load-test inserts get ids above the baseline, so deleting upward from
+        # there only ever removes rows this run created
+        with self.lock:
+            eid = self.next_delete
+            self.next_delete += 1
+            return eid
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+
+    def record(self, status, elapsed):
+        with self.lock:
+            self.latencies.append(elapsed)
+            if not 200 <= status < 400:
+                self.errors += 1
+
+def browse(client, seed, recorder):
+    path, columns = random.choice(list(LIST_PAGES.items()))
+    params = {"sort": random.choice(columns), "order": random.choice(["asc", "desc"])}
+    if random.random() < 0.5:
+        params["search"] = random.choice(seed.terms)
+    timed(recorder, client.request, "GET", f"{path}?{urllib.parse.urlencode(params)}")
+
+def report(client, seed, recorder):
+    if random.random() < 0.3:
+        timed(recorder, client.request, "GET", "/reports")
+    else:
+        timed(recorder, client.request, "POST", "/reports",
+              {"student_id": random.choice(seed.student_ids)})
+
+def pages(client, seed, recorder):
+    # Pages built on loaders.py; their query count should not grow with the rows shown
+    path = random.choice(["/rosters", "/instructor_loads", "/departments"])
+    if path == "/departments":
+        path = f"/departments/{random.choice(seed.department_ids)}"
+    elif path == "/rosters" and random.random() < 0.5:
+        path += f"?page={random.randint(1, 5)}"
+    timed(recorder, client.request, "GET", path)
+
+def search(client, seed, recorder):
+    term = random.choice(seed.terms)
+    timed(recorder, client.request, "GET", f"/search?{urllib.parse.urlencode({'q': term})}")
+
+def write(client, seed, recorder, burst=5):
+    for _ in range(burst):
+        timed(recorder, client.request, "POST", "/add_enrollment", {
+            "student_id": random.choice(seed.student_ids),
+            "section_id": random.choice(seed.section_ids),
+            "grade": ""
+        })
+    for _ in range(burst):
+        timed(recorder, client.request, "POST", "/delete_enrollment",
+              {"enrollment_id": seed.take_delete_id()})
+
+OPERATIONS = {"browse": browse, "report": report, "pages": pages, "search": search, "write": write}
+
+def timed(recorder, fn, *args):
+    start = time.perf_counter()
+    status = fn(*args)
+    recorder.record(status, time.perf_counter() - start)
+
+def db_connections(db):
+    """Server connections, not counting the load generator's own."""
+    try:
+        rows = db.rows("SHOW GLOBAL STATUS LIKE 'Threads_connected'")
+    except mysql.connector.Error:
+        return None
+    return int(rows[0][1]) - 1 if rows else None
+
+def cleanup(db, seed, settle=30.0):
+    """
+    Removes what the run wrote: enrollments above the baseline and the
+    write-behind tickets filed since it started. A write-behind server keeps
+    committing after the last response, so this waits until the number of new
+    enrollments stops changing (up to settle seconds) before deleting.
+    """
+    count_new = "SELECT COUNT(*) FROM enrollment WHERE enrollment_id > %s"
+    last = None
+    deadline = time.monotonic() + settle
+    while time.monotonic() < deadline:
+        count = db.rows(count_new, (seed.baseline_enrollment,))[0][0]
+        if count == last:
+            break
+        last = count
+        time.sleep(1)
+    db.run("DELETE FROM enrollment WHERE enrollment_id > %s", (seed.baseline_enrollment,))
+    db.run("DELETE FROM enrollment_request WHERE updated_at >= %s", (seed.started_at,))
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def run_step(client, db, seed, mix, concurrency, duration):
+    recorder = Recorder()
+    stop = time.monotonic() + duration
+    names = list(mix)
+    weights = [mix[n] for n in names]
+
+    def user():
+        while time.monotonic() < stop:
+            OPERATIONS[random.choices(names, weights)[0]](client, seed, recorder)
+
+    connections = []
+    sampling = threading.Event()
+
+    def sample():
+        while not sampling.wait(0.5):
+            count = db_connections(db)
+            if count is not None:
+                connections.append(count)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(user)
+    elapsed = time.perf_counter() - start
+    sampling.set()
+    sampler.join()
+
+    latencies = sorted(recorder.latencies)
+    total = len(latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "throughput": total / elapsed if elapsed > 0 else 0.0,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "error_rate": recorder.errors / total if total else 0.0,
+        "db_connections": max(connections) if connections else None,
+    }
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation '{name}' (expected one of {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="Registration-week load test for app.py")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--in-process", action="store_true",
+                        help="drive the app through Flask's test client instead of HTTP")
+    parser.add_argument("--steps", default="1,2,4,8,16,32",
+                        help="comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per step")
+    parser.add_argument("--mix", default="browse=40,report=20,pages=10,search=15,write=15",
+                        help="operation weights")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    mix = parse_mix(args.mix)
+    client = InProcessClient() if args.in_process else HttpClient(args.url)
+    db = Database()
+    seed = SeedData(db)
+
+    print(f"{'users':>6} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'errors':>7} {'db conns':>9}")
+    try:
+        for concurrency in [int(c) for c in args.steps.split(",")]:
+            r = run_step(client, db, seed, mix, concurrency, args.duration)
+            print(f"{r['concurrency']:>6} {r['requests']:>9} {r['throughput']:>8.1f} "
+                  f"{r['p50']:>8.1f} {r['p95']:>8.1f} {r['p99']:>8.1f} "
+                  f"{r['error_rate']:>7.1%} {str(r['db_connections']):>9}")
+    finally:
+        # Remove enrollments the run inserted but did not get to delete
+        cleanup(db, seed)
+
+if __name__ == "__main__":
+    main()
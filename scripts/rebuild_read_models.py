@@ -0,0 +1,14 @@
+import db_manager
+
+def main():
+    # Repopulates enrollment_roster and section_listing, e.g. after loading data
+    # with triggers disabled or after changing the read model tables
+    if db_manager.rebuild_read_models():
+        print("Read models rebuilt.")
+    else:
+        print("Error: could not rebuild read models. On a database created before they "
+              "existed, run python upgrade_schema.py first.")
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import functools
+import hashlib
+import mmap
+import os
+import pickle
+import stat
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: caching is disabled and calls pass straight through
+    fcntl = None
+
+# Report cache shared by every worker process on one host. Entries live in a
+# fixed-size mmap'd file split into slots, guarded by an flock. A generation
+# counter at the start of the file is bumped on every database write; entries
+# stored under an older generation are treated as misses, so all workers see
+# an invalidation as soon as it happens.
+#
+# Slots hold pickles, so the file must only be writable by the user running the
+# app: by default it lives in a per-user 0700 directory, and a file (or
+# directory) owned by someone else or open to group/other is refused, which
+# turns caching off.
+CACHE_DIR = os.path.join(tempfile.gettempdir(),
+                         f"academic_cache_{os.getuid() if hasattr(os, 'getuid') else 'user'}")
+CACHE_PATH = os.getenv("SHARED_CACHE_PATH") or os.path.join(CACHE_DIR, "report_cache.bin")
+SLOT_COUNT = int(os.getenv("SHARED_CACHE_SLOTS", 256))
+SLOT_SIZE = int(os.getenv("SHARED_CACHE_SLOT_SIZE", 64 * 1024))
+
+HEADER = struct.Struct("<Q")             # generation
+SLOT_HEADER = struct.Struct("<16sQdI")   # key digest, generation, expiry, payload length
+
+class SharedCache:
+    def __init__(self, path=CACHE_PATH, slots=SLOT_COUNT, slot_size=SLOT_SIZE):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.size = HEADER.size + slots * slot_size
+        self.fd = None
+        self.map = None
+        self.pid = None
+        # flock is per open file, so it cannot keep this process's own threads
+        # apart; they take this lock first
+        self.thread_lock = threading.Lock()
+        self.disabled = False
+        self.hits = 0
+        self.misses = 0
+
+    def open(self):
+        """Maps the cache file on first use, creating and sizing it if needed."""
+        # flock is tied to the open file, so a forked worker needs its own
+        if self.map is None or self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.thread_lock = threading.Lock()
+            directory = os.path.dirname(self.path)
+            if directory == CACHE_DIR:
+                os.makedirs(directory, mode=0o700, exist_ok=True)
+                self.check_private(os.lstat(directory), stat.S_ISDIR)
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+            try:
+                self.check_private(os.fstat(self.fd), stat.S_ISREG)
+            except PermissionError:
+                os.close(self.fd)
+                self.fd = None
+                raise
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self.fd).st_size < self.size:
+                    os.ftruncate(self.fd, self.size)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            self.map = mmap.mmap(self.fd, self.size)
+        return self.map
+
+    def check_private(self, st, is_type):
+        """Refuses (and disables the cache) unless st is ours and closed to others."""
+        if not is_type(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+            self.disabled = True
+            raise PermissionError(f"{self.path}: not a private cache file, caching disabled")
+
+    def lock(self, exclusive):
+        self.thread_lock.acquire()
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        except BaseException:
+            self.thread_lock.release()
+            raise
+
+    def unlock(self):
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        finally:
+            self.thread_lock.release()
+
+    def slot_offset(self, digest):
+        index = int.from_bytes(digest[:8], "little") % self.slots
+        return HEADER.size + index * self.slot_size
+
+    def generation(self):
+        return HEADER.unpack_from(self.open(), 0)[0]
+
+    def bump(self):
+        """Invalidates every entry in every process."""
+        m = self.open()
+        self.lock(True)
+        try:
+            HEADER.pack_into(m, 0, HEADER.unpack_from(m, 0)[0] + 1)
+        finally:
+            self.unlock()
+
+    def get(self, key):
+        """Returns (True, value) on a fresh hit, otherwise (False, None)."""
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        m = self.open()
+        offset = self.slot_offset(digest)
+        self.lock(False)
+        try:
+            generation = HEADER.unpack_from(m, 0)[0]
+            stored, stored_gen, expires, length = SLOT_HEADER.unpack_from(m, offset)
+            if stored != digest or stored_gen != generation or expires < time.time():
+                self.misses += 1
+                return False, None
+            start = offset + SLOT_HEADER.size
+            payload = m[start:start + length]
+        finally:
+            self.unlock()
+        self.hits += 1
+        return True, pickle.loads(payload)
+
+    def set(self, key, value, ttl, generation):
+        """
+        Stores value under the generation that was current before it was
+        computed, so a write that raced the computation leaves it stale.
+        Values that do not fit in one slot are not stored.
+        """
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.slot_size - SLOT_HEADER.size:
+            return False
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        m = self.open()
+        offset = self.slot_offset(digest)
+        self.lock(True)
+        try:
+            start = offset + SLOT_HEADER.size
+            m[start:start + len(payload)] = payload
+            SLOT_HEADER.pack_into(m, offset, digest, generation, time.time() + ttl, len(payload))
+        finally:
+            self.unlock()
+        return True
+
+cache = SharedCache()
+
+def invalidate():
+    """Called after every successful write so cached reports are never stale."""
+    if fcntl is None or cache.disabled:
+        return
+    try:
+        cache.bump()
+    except Exception as e:
+        print("CACHE ERROR:", e)
+
+def cached(ttl=60):
+    """Decorator caching a function's result in the shared cache by its arguments."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if fcntl is None or cache.disabled:
+                return fn(*args, **kwargs)
+            key = f"{fn.__module__}.{fn.__qualname__}:{args!r}:{sorted(kwargs.items())!r}"
+            try:
+                generation = cache.generation()
+                hit, value = cache.get(key)
+            except Exception as e:
+                print("CACHE ERROR:", e)
+                return fn(*args, **kwargs)
+            if hit:
+                return value
+            value = fn(*args, **kwargs)
+            # Failed queries return None; only cache real results
+            if value is not None:
+                try:
+                    cache.set(key, value, ttl, generation)
+                except Exception as e:
+                    print("CACHE ERROR:", e)
+            return value
+        return wrapper
+    return decorator
+
+
+def bench_worker(path, mode, seed, lookups, keys, query_ms, write_every, results):
+    import random
+
+    cache = SharedCache(path)
+    random.seed(seed)
+    local = {}
+    hits = stale = 0
+    start = time.perf_counter()
+    for i in range(lookups):
+        key = f"report:{random.randrange(keys)}"
+        generation = cache.generation()
+        if mode == "shared":
+            hit, _ = cache.get(key)
+            if not hit:
+                time.sleep(query_ms / 1000)
+                cache.set(key, key, 60, generation)
+        else:
+            # A per-process cache never hears about other workers' writes; the
+            # shared counter is only consulted to count the stale hits it serves
+            hit = key in local
+            if hit:
+                stale += local[key] != generation
+            else:
+                time.sleep(query_ms / 1000)
+                local[key] = generation
+        hits += hit
+        if seed == 0 and i % write_every == write_every - 1:
+            cache.bump()
+            if mode != "shared":
+                local.clear()
+    results.put((hits, stale, time.perf_counter() - start))
+
+def benchmark(workers=4, lookups=2000, keys=50, query_ms=2.0, write_every=500):
+    """
+    Compares a per-process dict cache against the shared cache. Each worker
+    looks up random report keys, a miss costs query_ms of simulated database
+    time, and every write_every lookups worker 0 performs a write. Runs on a
+    throwaway cache file so the application's cache is left alone.
+    """
+    import multiprocessing
+    import shutil
+
+    directory = tempfile.mkdtemp(prefix="academic_cache_bench_")
+    try:
+        for mode in ("per-process", "shared"):
+            path = os.path.join(directory, f"{mode}.bin")
+            results = multiprocessing.Queue()
+            procs = [multiprocessing.Process(target=bench_worker,
+                                             args=(path, mode, n, lookups, keys, query_ms,
+                                                   write_every, results))
+                     for n in range(workers)]
+            for p in procs:
+                p.start()
+            stats = [results.get() for _ in procs]
+            for p in procs:
+                p.join()
+            total = workers * lookups
+            hits = sum(s[0] for s in stats)
+            stale = sum(s[1] for s in stats)
+            elapsed = sum(s[2] for s in stats)
+            print(f"{mode:>12}: hit rate {hits / total:6.1%}, stale hits {stale:5d}, "
+                  f"mean latency {elapsed / total * 1000:.3f} ms")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    if fcntl is None:
+        print("The shared cache needs fcntl (Linux/macOS).")
+    else:
+        benchmark()
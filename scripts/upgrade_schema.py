@@ -0,0 +1,13 @@
+import db_manager
+
+def main():
+    # Adds the newer tables, columns, indexes and triggers to an existing
+    # database without dropping data (reset_tables wipes everything)
+    if db_manager.upgrade_schema():
+        print("Schema upgraded.")
+    else:
+        print("Error: could not upgrade the schema.")
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import atexit
+import itertools
+import os
+import threading
+import time
+import db_manager
+
+# Optional write-behind mode for enrollments. Accepted requests are queued in
+# this process and a background thread commits them as multi-row INSERTs every
+# FLUSH_ROWS rows or FLUSH_MS milliseconds. Each ticket's final status is
+# written to enrollment_request in the same transaction as its row, so any
+# worker can answer a status poll. A request is only durable once its status is
+# "committed"; anything still "queued" is lost if the process dies. At most
+# MAX_PENDING requests are held; past that, submissions are refused.
+ENABLED = os.getenv("ENROLLMENT_WRITE_BEHIND") == "1"
+FLUSH_ROWS = int(os.getenv("WRITE_BEHIND_ROWS", 500))
+FLUSH_MS = int(os.getenv("WRITE_BEHIND_MS", 200))
+MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", 10000))
+
+# A ticket no worker has a status for is reported as queued for this many
+# seconds after submission, since another worker may still hold it
+QUEUED_GRACE = 60
+# Statuses are kept this many days, pruned every PRUNE_EVERY flushes
+STATUS_DAYS = 1
+PRUNE_EVERY = 100
+
+INSERT_ENROLLMENT = "INSERT INTO enrollment (student_id, section_id, grade) VALUES (%s,%s,%s)"
+INSERT_REQUEST = "INSERT INTO enrollment_request (ticket, status) VALUES (%s,%s)"
+
+def multi_row(query, rows):
+    """Expands a single-row INSERT ... VALUES (...) into one statement over rows."""
+    head, _, values = query.partition(" VALUES ")
+    return head + " VALUES " + ",".join([values] * len(rows)), tuple(v for row in rows for v in row)
+
+class EnrollmentQueue:
+    def __init__(self, flush_rows=FLUSH_ROWS, flush_ms=FLUSH_MS, max_pending=MAX_PENDING):
+        self.flush_rows = flush_rows
+        self.flush_ms = flush_ms
+        self.max_pending = max_pending
+        self.cond = threading.Condition()
+        self.pending = []
+        self.queued = set()
+        self.ids = itertools.count(1)
+        self.thread = None
+        self.commits = 0
+        self.flushes = 0
+
+    def submit(self, student_id, section_id, grade):
+        """Queues one enrollment and returns its ticket, or None if the queue is full."""
+        with self.cond:
+            # queued also holds the batch being flushed, so both count toward the cap
+            if len(self.queued) >= self.max_pending:
+                return None
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            ticket = f"{os.getpid()}-{int(time.time() * 1000)}-{next(self.ids)}"
+            self.pending.append((ticket, (student_id, section_id, grade)))
+            self.queued.add(ticket)
+            if len(self.pending) >= self.flush_rows:
+                self.cond.notify()
+            return ticket
+
+    def get_status(self, ticket):
+        """Returns "queued", "committed", "failed" or None for an unknown ticket."""
+        with self.cond:
+            if ticket in self.queued:
+                return "queued"
+        rows = db_manager.query_rows(
+            "SELECT status FROM enrollment_request WHERE ticket = %s", (ticket,))
+        if rows:
+            return rows[0][0]
+        try:
+            submitted = int(ticket.split("-")[1]) / 1000
+        except (IndexError, ValueError):
+            return None
+        return "queued" if time.time() - submitted < QUEUED_GRACE else None
+
+    def run(self):
+        while True:
+            with self.cond:
+                deadline = time.monotonic() + self.flush_ms / 1000
+                while len(self.pending) < self.flush_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                batch = self.take()
+            if batch and not self.flush(batch):
+                time.sleep(self.flush_ms / 1000)
+
+    def take(self):
+        """Removes and returns up to flush_rows pending requests; call with cond held."""
+        batch = self.pending[:self.flush_rows]
+        del self.pending[:self.flush_rows]
+        return batch
+
+    def flush(self, batch):
+        """
+        Commits a batch and its tickets' statuses in one transaction of two
+        multi-row INSERTs. If the batch fails (for example a bad student or
+        section id), rows are retried one by one so only the offending requests
+        are marked failed. If the database cannot be reached at all, the batch
+        goes back to the front of the queue untouched and False is returned.
+        """
+        tickets = [ticket for ticket, _ in batch]
+        if db_manager.execute_many([
+            multi_row(INSERT_ENROLLMENT, [row for _, row in batch]),
+            multi_row(INSERT_REQUEST, [(ticket, "committed") for ticket in tickets]),
+        ]):
+            self.commits += 1
+        elif not db_manager.query_all("SELECT 1"):
+            with self.cond:
+                self.pending[:0] = batch
+            return False
+        else:
+            for ticket, row in batch:
+                ok = db_manager.execute_many([(INSERT_ENROLLMENT, row),
+                                              (INSERT_REQUEST, (ticket, "committed"))])
+                self.commits += ok
+                if not ok:
+                    db_manager.execute(INSERT_REQUEST, (ticket, "failed"))
+        self.flushes += 1
+        if self.flushes % PRUNE_EVERY == 0:
+            db_manager.execute("DELETE FROM enrollment_request WHERE updated_at < NOW() - INTERVAL %s DAY",
+                               (STATUS_DAYS,))
+        # Statuses are readable from the table now, so the tickets stop being local
+        with self.cond:
+            self.queued.difference_update(tickets)
+        return True
+
+    def drain(self):
+        """Flushes whatever is queued right now; used at interpreter exit."""
+        while True:
+            with self.cond:
+                batch = self.take()
+            if not batch or not self.flush(batch):
+                return
+
+def validate_enrollment(form):
+    """
+    Returns (student_id, section_id, grade) or None if the form is invalid.
+    Grades are checked against the grade_scale table, the same source the
+    quality_points triggers use.
+    """
+    try:
+        student_id = int(form['student_id'])
+        section_id = int(form['section_id'])
+    except (KeyError, ValueError):
+        return None
+    grade = (form.get('grade') or '').strip().upper() or None
+    if grade is not None and not db_manager.query_rows(
+            "SELECT 1 FROM grade_scale WHERE grade = %s", (grade,)):
+        return None
+    return student_id, section_id, grade
+
+enrollments = EnrollmentQueue()
+atexit.register(enrollments.drain)